@@ -1,9 +1,12 @@
 # backend/database.py
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
+import os
+from sqlalchemy import create_engine, event, insert, Column, Integer, String, Text, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///learnmate.db")
+
 Base = declarative_base()
 
 class UserRequest(Base):
@@ -13,4 +16,38 @@ class UserRequest(Base):
     action = Column(String)  # 'translate', 'analyze', 'transcribe'
     file_type = Column(String)
     timestamp = Column(DateTime, default=datetime.utcnow)
-    status = Column(String)  # 'pending', 'completed', 'failed'
\ No newline at end of file
+    status = Column(String)  # 'pending', 'completed', 'failed'
+
+
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
+    pool_size=5,
+    pool_pre_ping=True
+)
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """WAL lets readers and the batch writer proceed without blocking each other"""
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+SessionLocal = sessionmaker(bind=engine)
+
+
+def init_db() -> None:
+    """Create tables if they do not exist"""
+    Base.metadata.create_all(engine)
+
+
+def save_user_requests(rows: list[dict]) -> None:
+    """Insert a batch of UserRequest rows in a single round-trip"""
+    if not rows:
+        return
+    with SessionLocal() as session:
+        session.execute(insert(UserRequest), rows)
+        session.commit()
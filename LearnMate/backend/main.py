@@ -5,18 +5,22 @@ import os
 load_dotenv()  
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Response, Request, BackgroundTasks
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse
-import tempfile
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse
 import logging
+from models._llm import LLMError
 from models.translation import TranslationModel
 from models.code_analysis import CodeAnalysisModel
 from models.youtube import YouTubeTranscriber
 from utils.file_processing import FileProcessor
 from utils.helpers import Helpers
+from utils.notebook import extract_code as extract_notebook_code
+from utils import llm_cache
+from database import init_db, save_user_requests
 import io
-from io import BytesIO
 import asyncio
-import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -25,7 +29,61 @@ from fastapi.middleware.cors import CORSMiddleware
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Request log: handlers enqueue rows, a background task writes them in batches
+LOG_FLUSH_INTERVAL = 0.5  # seconds
+request_log: asyncio.Queue = asyncio.Queue()
+
+def log_request(action: str, file_type: str | None, status: str, user_id: str | None = None) -> None:
+    """Queue a UserRequest row without blocking the response"""
+    request_log.put_nowait({
+        "user_id": user_id,
+        "action": action,
+        "file_type": file_type,
+        "status": status,
+        "timestamp": datetime.utcnow()  # time of the request, not of the batch flush
+    })
+
+async def flush_request_log() -> None:
+    """Write all queued request log rows in one batch"""
+    batch = []
+    while not request_log.empty():
+        batch.append(request_log.get_nowait())
+    if batch:
+        try:
+            await asyncio.to_thread(save_user_requests, batch)
+        except Exception as e:
+            logger.error(f"Failed to write request log: {str(e)}")
+
+async def request_log_writer() -> None:
+    while True:
+        await asyncio.sleep(LOG_FLUSH_INTERVAL)
+        await flush_request_log()
+
+async def logged_stream(chunks: AsyncIterator[str], action: str, file_type: str | None) -> AsyncIterator[str]:
+    """Relay a model stream and log the request once it has been consumed"""
+    status = "failed"
+    try:
+        async for chunk in chunks:
+            yield chunk
+        status = "completed"
+    except LLMError as e:
+        # Headers are already sent, so the error goes out as the last chunk
+        yield str(e)
+    finally:
+        log_request(action, file_type, status)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(init_db)
+    writer = asyncio.create_task(request_log_writer())
+    # Warm the tokenizer in the background; startup does not wait on its download
+    tokenizer = asyncio.create_task(asyncio.to_thread(code_analysis_model.load_tokenizer))
+    yield
+    writer.cancel()
+    await flush_request_log()
+    await llm_cache.close()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -57,37 +115,76 @@ async def validate_request(request: Request, call_next):
             status_code=500
         )
 
+async def extract_document_text(file: UploadFile, ext: str) -> str:
+    """Extract translatable text from an uploaded document"""
+    # Verify file content without copying the upload into memory
+    file_stream = file.file
+    file_stream.seek(0, 2)
+    size = file_stream.tell()
+    file_stream.seek(0)
+    if not size:
+        raise HTTPException(status_code=400, detail="Empty file content")
+    
+    # Process file based on type
+    # Extractors are blocking, so run them off the event loop.
+    # Binary formats read straight from the spooled upload file.
+    if ext == ".pdf":
+        text = await asyncio.to_thread(file_processor.extract_text_from_pdf, file_stream)
+    elif ext == ".docx":
+        text = await asyncio.to_thread(file_processor.extract_text_from_docx, file_stream)
+    elif ext == ".pptx":
+        text = await asyncio.to_thread(file_processor.extract_text_from_pptx, file_stream)
+    elif ext == ".ipynb":
+        content = await file.read()
+        text = await asyncio.to_thread(file_processor.extract_code_from_ipynb, content)
+    elif ext == ".txt":
+        content = await file.read()
+        text = await asyncio.to_thread(file_processor.process_txt, content)
+    else:
+        raise HTTPException(400, detail="Unsupported file type")
+
+    if not text.strip():
+        raise HTTPException(400, detail="No extractable text")
+
+    return text
+
+
+async def extract_source_code(file: UploadFile, ext: str) -> str:
+    """Extract source code from an uploaded script or notebook"""
+    # Read file content
+    content = await file.read()
+    logger.info(f"File extension: {ext}, content length: {len(content)}")
+
+    # Handle .ipynb separately
+    if ext == "ipynb":
+        try:
+            code = await asyncio.to_thread(extract_notebook_code, content)
+        except Exception as e:
+            logger.error(f"Failed to parse notebook: {e}")
+            raise HTTPException(400, detail="Invalid Jupyter notebook format")
+    else:
+        try:
+            code = content.decode('utf-8')
+        except Exception as e:
+            logger.error(f"Failed to decode file: {e}")
+            raise HTTPException(400, detail="File decoding error")
+
+    logger.info(f"Extracted code length: {len(code)}")
+    logger.info(f"Code sample: {code[:200]}...")
+    return code
+
+
 @app.post("/translate_file")
 async def translate_file(file: UploadFile = File(...)):
+    ext = Helpers.get_file_extension(file.filename)
     try:
-        # Verify file content
-        content = await file.read()
-        if not content:
-            raise HTTPException(status_code=400, detail="Empty file content")
-        
-        file_stream = BytesIO(content)
-        ext = Helpers.get_file_extension(file.filename)
-        
-        # Process file based on type
-        if ext == ".pdf":
-            text = file_processor.extract_text_from_pdf(file_stream)
-        elif ext == ".docx":
-            text = file_processor.extract_text_from_docx(file_stream)
-        elif ext == ".pptx":
-            text = file_processor.extract_text_from_pptx(file_stream)
-        elif ext == ".ipynb":
-            text = file_processor.extract_code_from_ipynb(content)
-        elif ext == ".txt":
-            text = file_processor.process_txt(content)
-        else:
-            raise HTTPException(400, detail="Unsupported file type")
-
-        if not text.strip():
-            raise HTTPException(400, detail="No extractable text")
+        text = await extract_document_text(file, ext)
 
         # Perform translation
-        translated_content = translation_model.translate_text(text)
+        translated_content = await translation_model.translate_text(text)
         
+        log_request("translate", ext, "completed")
+
         # Return response with ALL required fields
         return {
             "status": "success",
@@ -99,8 +196,14 @@ async def translate_file(file: UploadFile = File(...)):
         }
         
     except HTTPException as he:
+        log_request("translate", ext, "failed")
         raise
+    except LLMError as e:
+        # A failed model call is an upstream error, not a translation to hand back
+        log_request("translate", ext, "failed")
+        raise HTTPException(502, detail=str(e))
     except Exception as e:
+        log_request("translate", ext, "failed")
         logger.error(f"Translation failed: {str(e)}")
         raise HTTPException(500, detail="File processing failed")
 
@@ -112,56 +215,82 @@ async def analyze_code(
     file: UploadFile = File(...),
     analysis_type: str = Form("explain")   # new: allow passing analysis type
 ):
+    ext = file.filename.split('.')[-1].lower()
     try:
         logger.info(f"Analyze code endpoint called for file: {file.filename}")
-
-        # Read file content
-        content = await file.read()
-        ext = file.filename.split('.')[-1].lower()
-        logger.info(f"File extension: {ext}, content length: {len(content)}")
-
-        # Handle .ipynb separately
-        if ext == "ipynb":
-            try:
-                nb_json = json.loads(content.decode('utf-8'))
-                code_cells = []
-                for cell in nb_json.get('cells', []):
-                    if cell.get('cell_type') == 'code':
-                        code_cells.append(''.join(cell.get('source', [])))
-                code = '\n\n'.join(code_cells)
-            except Exception as e:
-                logger.error(f"Failed to parse notebook: {e}")
-                raise HTTPException(400, detail="Invalid Jupyter notebook format")
-        else:
-            try:
-                code = content.decode('utf-8')
-            except Exception as e:
-                logger.error(f"Failed to decode file: {e}")
-                raise HTTPException(400, detail="File decoding error")
-
-        logger.info(f"Extracted code length: {len(code)}")
-        logger.info(f"Code sample: {code[:200]}...")
+        code = await extract_source_code(file, ext)
 
         # Call analysis model
-        explanation = code_analysis_model.explain_code(code, analysis_type)
+        explanation = await code_analysis_model.explain_code(code, analysis_type)
         logger.info(f"Final explanation from model: '{explanation[:200]}...'")
 
         if not explanation or not explanation.strip():
             logger.error("Empty explanation generated")
             raise HTTPException(500, detail="No analysis generated - empty response")
 
+        log_request("analyze", ext, "completed")
+
         return {
             "status": "success",
             "explanation": explanation,
             "filename": file.filename
         }
     except HTTPException:
+        log_request("analyze", ext, "failed")
         raise
+    except LLMError as e:
+        log_request("analyze", ext, "failed")
+        raise HTTPException(502, detail=str(e))
     except Exception as e:
+        log_request("analyze", ext, "failed")
         logger.error(f"Code analysis failed: {str(e)}", exc_info=True)
         raise HTTPException(500, detail="Code analysis failed")
 
 
+# Streaming variants: the async generators are consumed directly by Starlette on
+# the event loop (a plain generator would be iterated in the thread pool)
+@app.post("/translate_file_stream")
+async def translate_file_stream(file: UploadFile = File(...)):
+    ext = Helpers.get_file_extension(file.filename)
+    try:
+        text = await extract_document_text(file, ext)
+    except HTTPException:
+        log_request("translate", ext, "failed")
+        raise
+    except Exception as e:
+        log_request("translate", ext, "failed")
+        logger.error(f"Translation failed: {str(e)}")
+        raise HTTPException(500, detail="File processing failed")
+
+    return StreamingResponse(
+        logged_stream(translation_model.translate_text_stream(text), "translate", ext),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
+@app.post("/analyze_code_stream")
+async def analyze_code_stream(
+    file: UploadFile = File(...),
+    analysis_type: str = Form("explain")
+):
+    ext = file.filename.split('.')[-1].lower()
+    try:
+        logger.info(f"Analyze code stream endpoint called for file: {file.filename}")
+        code = await extract_source_code(file, ext)
+    except HTTPException:
+        log_request("analyze", ext, "failed")
+        raise
+    except Exception as e:
+        log_request("analyze", ext, "failed")
+        logger.error(f"Code analysis failed: {str(e)}", exc_info=True)
+        raise HTTPException(500, detail="Code analysis failed")
+
+    return StreamingResponse(
+        logged_stream(code_analysis_model.explain_code_stream(code, analysis_type), "analyze", ext),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
 @app.post("/transcribe_youtube")
 async def transcribe_youtube(request: Request):
     try:
@@ -171,20 +300,9 @@ async def transcribe_youtube(request: Request):
             raise HTTPException(status_code=400, detail="video_url is required")
         
         # Get transcript using AI
-        transcript_result = await asyncio.to_thread(
-            youtube_transcriber.get_transcript, 
-            video_url
-        )
+        transcript_result = await youtube_transcriber.get_transcript(video_url)
         
-        # Create a temporary file with the transcript
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', encoding='utf-8', delete=False) as temp_file:
-            transcript_text = transcript_result["text"]
-            language = transcript_result.get("language", "ru")
-            source = transcript_result.get("source", "ai")
-            
-            # Write transcript to file
-            temp_file.write(transcript_text)
-            temp_file_path = temp_file.name
+        transcript_bytes = transcript_result["text"].encode("utf-8")
         
         # Extract video ID for filename
         try:
@@ -193,16 +311,20 @@ async def transcribe_youtube(request: Request):
         except:
             filename = "youtube_transcript.txt"
         
-        # Return as file download
-        return FileResponse(
-            path=temp_file_path,
-            filename=filename,
-            media_type='text/plain'
+        log_request("transcribe", "youtube", "completed")
+
+        # Return as file download straight from memory
+        return Response(
+            content=transcript_bytes,
+            media_type="text/plain; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
             
     except HTTPException:
+        log_request("transcribe", "youtube", "failed")
         raise
     except Exception as e:
+        log_request("transcribe", "youtube", "failed")
         logger.error(f"Transcription failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,82 @@
+# backend/models/_llm.py
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from openai import APIConnectionError, InternalServerError, RateLimitError
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+from utils.llm_cache import get_cached, set_cached
+
+
+logger = logging.getLogger(__name__)
+
+# Shared by every OpenRouter caller so the outbound request budget is enforced globally
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "16"))
+LLM_SEMAPHORE = asyncio.Semaphore(LLM_CONCURRENCY)
+
+# Transient failures worth retrying: 429s, 5xx and network errors (including timeouts)
+RETRYABLE_ERRORS = (RateLimitError, InternalServerError, APIConnectionError)
+
+
+class LLMError(Exception):
+    """A model call failed; the message is the user-facing error text"""
+
+
+def llm_retrying() -> AsyncRetrying:
+    """Jittered exponential backoff for transient OpenRouter failures"""
+    return AsyncRetrying(
+        stop=stop_after_attempt(4),
+        wait=wait_random_exponential(multiplier=0.5, max=8),
+        retry=retry_if_exception_type(RETRYABLE_ERRORS),
+        reraise=True
+    )
+
+
+async def create_completion(client, **params):
+    """Create a chat completion, retrying transient errors outside the concurrency slot"""
+    async for attempt in llm_retrying():
+        with attempt:
+            async with LLM_SEMAPHORE:
+                return await client.chat.completions.create(**params)
+
+
+@asynccontextmanager
+async def open_completion_stream(client, **params):
+    """Open a streaming chat completion, retrying transient errors outside the concurrency slot"""
+    async for attempt in llm_retrying():
+        with attempt:
+            # Take the slot per attempt so backoff sleeps do not occupy it
+            await LLM_SEMAPHORE.acquire()
+            try:
+                stream = await client.chat.completions.create(**params, stream=True)
+            except BaseException:
+                LLM_SEMAPHORE.release()
+                raise
+    # The successful attempt keeps its slot while the stream is consumed
+    try:
+        yield stream
+    finally:
+        LLM_SEMAPHORE.release()
+
+
+async def stream_completion(client, key: str, params: dict, error_prefix: str) -> AsyncIterator[str]:
+    """Yield a chat completion as it is generated, serving from and filling the LLM cache"""
+    cached = await get_cached(key)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        async with open_completion_stream(client, **params) as stream:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    except Exception as e:
+        logger.error(f"Streaming completion failed: {str(e)}", exc_info=True)
+        raise LLMError(f"{error_prefix}: {str(e)}") from e
+
+    await set_cached(key, "".join(parts).strip())
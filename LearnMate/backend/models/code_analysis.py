@@ -2,81 +2,139 @@
 from dotenv import load_dotenv
 load_dotenv() 
 
+import asyncio
+import hashlib
 import logging
 import json
-import nbformat
 from pathlib import Path
 import os
-from openai import OpenAI 
+import threading
+import time
+import tiktoken
+from openai import AsyncOpenAI
+from typing import AsyncIterator, Optional
+from models._llm import LLMError, create_completion, stream_completion
+from utils.llm_cache import get_or_call
+from utils.notebook import extract_code
 
 
 
 logger = logging.getLogger(__name__)
 
+# Code budget for the prompt; well within the model context after max_tokens for the answer
+MAX_PROMPT_TOKENS = 8000
+MAX_PROMPT_CHARS = 2000  # character cap used when the tokenizer is unavailable
+ENCODING_RETRY_INTERVAL = 60  # seconds before a failed tokenizer load is tried again
+_enc: Optional[tiktoken.Encoding] = None
+_enc_retry_at = 0.0
+_enc_lock = threading.Lock()
+
+
+def _get_encoding() -> Optional[tiktoken.Encoding]:
+    """Return the tokenizer, loading it if needed; None while it cannot be loaded (blocking)"""
+    global _enc, _enc_retry_at
+    if _enc is None and time.monotonic() >= _enc_retry_at:
+        with _enc_lock:
+            if _enc is None and time.monotonic() >= _enc_retry_at:
+                try:
+                    # May download the BPE file, so callers run this off the event loop
+                    _enc = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    # Not memoized: a transient failure falls back to characters only for a while
+                    _enc_retry_at = time.monotonic() + ENCODING_RETRY_INTERVAL
+                    logger.warning(f"tiktoken unavailable, truncating by characters: {str(e)}")
+    return _enc
 
 
 class CodeAnalysisModel:
     def __init__(self):
-        self.client = OpenAI(
+        self.client = AsyncOpenAI(
         base_url="https://openrouter.ai/api/v1",
-        api_key=os.getenv("OPENROUTER_API_KEY")
+        api_key=os.getenv("OPENROUTER_API_KEY"),
+        max_retries=0  # retries are handled in models._llm
         )
 
+    def load_tokenizer(self) -> None:
+        """Load the tokenizer ahead of the first analysis (blocking; run it in a thread)"""
+        _get_encoding()
+
     def extract_code_from_notebook(self, notebook_path: str) -> str:
         """Extract code from Jupyter notebook"""
         try:
-            with open(notebook_path, 'r', encoding='utf-8') as f:
-                notebook = nbformat.read(f, as_version=4)
-            
-            code_cells = []
-            for cell in notebook.cells:
-                if cell.cell_type == 'code':
-                    code_cells.append(cell.source)
+            with open(notebook_path, 'rb') as f:
+                content = f.read()
             
-            return "\n\n# --- Next Cell ---\n\n".join(code_cells)
+            return extract_code(content, separator="\n\n# --- Next Cell ---\n\n")
         except Exception as e:
             logger.error(f"Failed to read notebook: {str(e)}")
             raise
 
-    def explain_code(self, code: str, analysis_type: str = "explain") -> str:
+    @staticmethod
+    def _request(code: str, analysis_type: str) -> tuple[str, dict]:
+        """Build the cache key and chat completion arguments for a code analysis"""
+        clean_code = code.strip()
+        enc = _get_encoding()
+        if enc is None:
+            if len(clean_code) > MAX_PROMPT_CHARS:
+                clean_code = clean_code[:MAX_PROMPT_CHARS] + "\n# ... (code truncated for analysis)"
+        else:
+            tokens = enc.encode(clean_code, disallowed_special=())
+            if len(tokens) > MAX_PROMPT_TOKENS:
+                clean_code = enc.decode(tokens[:MAX_PROMPT_TOKENS]) + "\n# ... (code truncated for analysis)"
+
+        prompts = {
+            "explain": f"Explain the following Python code:\n\n{clean_code}",
+            "implement": f"Write a step-by-step implementation guide for this code:\n\n{clean_code}",
+            "review": f"Review the following Python code. List issues, improvements, and best practices:\n\n{clean_code}"
+        }
+
+        prompt = prompts.get(analysis_type, prompts["explain"])
+
+        model = "openai/gpt-5-codex"
+        key = hashlib.sha256(f"{model}|{analysis_type}|{clean_code}".encode()).hexdigest()
+        params = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": "You are a helpful coding tutor for students."},
+                {"role": "user", "content": prompt}
+            ],
+            "temperature": 0.5,
+            "max_tokens": 600
+        }
+        return key, params
+
+    async def explain_code(self, code: str, analysis_type: str = "explain") -> str:
         """Analyze code using OpenAI API instead of local models"""
-        try:
-            clean_code = code.strip()
-            if len(clean_code) > 2000:
-                clean_code = clean_code[:2000] + "\n# ... (code truncated for analysis)"
-
-            prompts = {
-                "explain": f"Explain the following Python code:\n\n{clean_code}",
-                "implement": f"Write a step-by-step implementation guide for this code:\n\n{clean_code}",
-                "review": f"Review the following Python code. List issues, improvements, and best practices:\n\n{clean_code}"
-            }
-
-            prompt = prompts.get(analysis_type, prompts["explain"])
-
-            response = self.client.chat.completions.create(
-                model="openai/gpt-5-codex",   
-                messages=[
-                    {"role": "system", "content": "You are a helpful coding tutor for students."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.5,
-                max_tokens=600
-            )
-
-            explanation = response.choices[0].message.content.strip()
-            return explanation if explanation else "⚠️ No explanation generated."
+        # Tokenizing a large notebook (or loading the tokenizer) must not block the event loop
+        key, params = await asyncio.to_thread(self._request, code, analysis_type)
+
+        async def call_model() -> str:
+            response = await create_completion(self.client, **params)
+            return response.choices[0].message.content.strip()
 
+        try:
+            explanation = await get_or_call(key, call_model)
         except Exception as e:
             logger.error(f"Code analysis failed: {str(e)}", exc_info=True)
-            return f"⚠️ Error during code analysis: {str(e)}"
+            raise LLMError(f"⚠️ Error during code analysis: {str(e)}") from e
+
+        if not explanation:
+            raise LLMError("⚠️ No explanation generated.")
+        return explanation
+
+    async def explain_code_stream(self, code: str, analysis_type: str = "explain") -> AsyncIterator[str]:
+        """Analyze code using OpenAI API, yielding the analysis as it is generated"""
+        key, params = await asyncio.to_thread(self._request, code, analysis_type)
+        async for delta in stream_completion(self.client, key, params, "⚠️ Error during code analysis"):
+            yield delta
 
-    def process_notebook(self, notebook_path: str, analysis_type: str = "explain") -> str:
+    async def process_notebook(self, notebook_path: str, analysis_type: str = "explain") -> str:
         """Process a Jupyter notebook and analyze its code"""
         try:
             code = self.extract_code_from_notebook(notebook_path)
             if not code.strip():
                 return "⚠️ No code cells found in the notebook."
-            return self.explain_code(code, analysis_type)
+            return await self.explain_code(code, analysis_type)
         except Exception as e:
             logger.error(f"Notebook processing failed: {str(e)}", exc_info=True)
             return f"⚠️ Failed to process notebook: {str(e)}"
@@ -2,45 +2,74 @@
 from dotenv import load_dotenv
 load_dotenv()
 
+import hashlib
 import logging
 import os
-from openai import OpenAI
+from openai import AsyncOpenAI
+from typing import AsyncIterator
+from models._llm import LLMError, create_completion, stream_completion
+from utils.llm_cache import get_or_call
 
 logger = logging.getLogger(__name__)
 
 class TranslationModel:
     def __init__(self):
         # Initialize OpenRouter client
-        self.client = OpenAI(
+        self.client = AsyncOpenAI(
             base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv("OPENROUTER_API_KEY")
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            max_retries=0  # retries are handled in models._llm
         )
 
-    def translate_text(self, text: str, source_lang: str = "ru", target_lang: str = "en") -> str:
+    @staticmethod
+    def _request(text: str, source_lang: str, target_lang: str) -> tuple[str, dict]:
+        """Build the cache key and chat completion arguments for a translation"""
+        model = "openai/gpt-4o"   # lightweight + fast
+        key = hashlib.sha256(f"{model}|{source_lang}|{target_lang}|{text}".encode()).hexdigest()
+        params = {
+            "model": model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": (
+                        f"You are a professional translator. Translate from {source_lang} to {target_lang}. "
+                        f"Do not add extra commentary, only return the translated text."
+                    )
+                },
+                {"role": "user", "content": text}
+            ],
+            "temperature": 0,
+            "max_tokens": 1000
+        }
+        return key, params
+
+    async def translate_text(self, text: str, source_lang: str = "ru", target_lang: str = "en") -> str:
         """Translate text using OpenRouter API"""
         if not text.strip():
             return ""
 
-        try:
-            response = self.client.chat.completions.create(
-                model="openai/gpt-4o",   # lightweight + fast
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            f"You are a professional translator. Translate from {source_lang} to {target_lang}. "
-                            f"Do not add extra commentary, only return the translated text."
-                        )
-                    },
-                    {"role": "user", "content": text}
-                ],
-                temperature=0,
-                max_tokens=1000
-            )
-
-            translated = response.choices[0].message.content.strip()
-            return translated if translated else "⚠️ Translation service unavailable"
+        key, params = self._request(text, source_lang, target_lang)
 
+        async def call_model() -> str:
+            response = await create_completion(self.client, **params)
+            return response.choices[0].message.content.strip()
+
+        try:
+            translated = await get_or_call(key, call_model)
         except Exception as e:
             logger.error(f"Translation failed: {str(e)}", exc_info=True)
-            return f"⚠️ Translation service unavailable: {str(e)}"
+            raise LLMError(f"⚠️ Translation service unavailable: {str(e)}") from e
+
+        if not translated:
+            raise LLMError("⚠️ Translation service unavailable")
+        return translated
+
+    async def translate_text_stream(self, text: str, source_lang: str = "ru",
+                                    target_lang: str = "en") -> AsyncIterator[str]:
+        """Translate text using OpenRouter API, yielding the translation as it is generated"""
+        if not text.strip():
+            return
+
+        key, params = self._request(text, source_lang, target_lang)
+        async for delta in stream_completion(self.client, key, params, "⚠️ Translation service unavailable"):
+            yield delta
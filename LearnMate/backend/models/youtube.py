@@ -1,18 +1,51 @@
 # backend/models/youtube.py
+import asyncio
+import functools
 import re
 import logging
 import os
+import shutil
+import subprocess
 import tempfile
+import threading
+import numpy as np
+from typing import Iterable
 from fastapi import HTTPException
 from yt_dlp import YoutubeDL
-import whisper
+from yt_dlp.utils import DownloadCancelled
+import ctranslate2
+from faster_whisper import WhisperModel
 
 logger = logging.getLogger(__name__)
 
+_VIDEO_ID_PATTERNS = [
+    re.compile(r"(?:https?:\/\/)?(?:www\.)?youtu\.be\/([a-zA-Z0-9_-]+)"),
+    re.compile(r"(?:https?:\/\/)?(?:www\.)?youtube\.com\/watch\?v=([a-zA-Z0-9_-]+)"),
+    re.compile(r"(?:https?:\/\/)?(?:www\.)?youtube\.com\/embed\/([a-zA-Z0-9_-]+)"),
+]
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_CAPTION_HEADER_PREFIXES = ("WEBVTT", "Kind:", "Language:", "<?xml", "<tt", "</tt")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def _extract_video_id_cached(url: str) -> str | None:
+    """Match a URL against the known YouTube patterns; None if none match"""
+    for pattern in _VIDEO_ID_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return match.group(1)
+    return None
+
 class YouTubeTranscriber:
     def __init__(self):
         try:
-            self.model = whisper.load_model("base")
+            use_cuda = ctranslate2.get_cuda_device_count() > 0
+            self.model = WhisperModel(
+                "base",
+                device="cuda" if use_cuda else "cpu",
+                compute_type="float16" if use_cuda else "int8"
+            )
             logger.info("Whisper model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load Whisper model: {str(e)}")
@@ -21,17 +54,11 @@ class YouTubeTranscriber:
     @staticmethod
     def extract_video_id(url: str) -> str:
         """Extract YouTube video ID"""
-        patterns = [
-            r"(?:https?:\/\/)?(?:www\.)?youtu\.be\/([a-zA-Z0-9_-]+)",
-            r"(?:https?:\/\/)?(?:www\.)?youtube\.com\/watch\?v=([a-zA-Z0-9_-]+)",
-            r"(?:https?:\/\/)?(?:www\.)?youtube\.com\/embed\/([a-zA-Z0-9_-]+)",
-        ]
         url = url.split("&")[0]
-        for pattern in patterns:
-            match = re.search(pattern, url)
-            if match:
-                return match.group(1)
-        raise ValueError(f"Invalid YouTube URL: {url}")
+        video_id = _extract_video_id_cached(url)
+        if video_id is None:
+            raise ValueError(f"Invalid YouTube URL: {url}")
+        return video_id
 
     def _get_youtube_captions(self, video_url: str) -> dict | None:
         """Try to fetch existing YouTube captions/subtitles"""
@@ -94,8 +121,9 @@ class YouTubeTranscriber:
     def _download_and_parse_captions(self, caption_url: str, lang: str, fmt: str) -> dict | None:
         """Download and parse caption file"""
         try:
+            import codecs
+            import itertools
             import urllib.request
-            import json
             
             req = urllib.request.Request(
                 caption_url,
@@ -103,14 +131,15 @@ class YouTubeTranscriber:
             )
             
             with urllib.request.urlopen(req, timeout=30) as response:
-                content = response.read().decode("utf-8")
-            
-            # Handle JSON3 format (YouTube's native JSON format)
-            if fmt == "json3" or content.strip().startswith("{"):
-                text = self._parse_json3_captions(content)
-            else:
-                # Parse VTT/SRV/TTML format - extract text only
-                text = self._parse_vtt_captions(content)
+                reader = codecs.getreader("utf-8")(response)
+                first_line = "" if fmt == "json3" else reader.readline()
+
+                # Handle JSON3 format (YouTube's native JSON format)
+                if fmt == "json3" or first_line.lstrip().startswith("{"):
+                    text = self._parse_json3_captions(first_line + reader.read())
+                else:
+                    # Parse VTT/SRV/TTML format line by line as it is received
+                    text = self._parse_vtt_captions(itertools.chain((first_line,), reader))
             
             if text and len(text) > 50:
                 logger.info(f"✅ Extracted {len(text)} characters from YouTube captions")
@@ -146,74 +175,67 @@ class YouTubeTranscriber:
             # Join and clean up
             text = " ".join(text_parts)
             # Remove multiple spaces
-            text = re.sub(r"\s+", " ", text)
+            text = _WHITESPACE_RE.sub(" ", text)
             return text.strip()
             
         except json.JSONDecodeError as e:
             logger.warning(f"Failed to parse JSON3: {e}")
             return ""
 
-    def _parse_vtt_captions(self, content: str) -> str:
-        """Parse VTT/SRV/TTML caption format"""
-        lines = content.split("\n")
-        text_lines = []
+    def _parse_vtt_captions(self, lines: Iterable[str]) -> str:
+        """Parse VTT/SRV/TTML caption format in a single pass"""
+        seen = set()
+        unique_lines = []
         
         for line in lines:
             line = line.strip()
-            # Skip timing lines, headers, and empty lines
-            if not line:
+            # Skip empty lines and timing lines (the most common cases first)
+            if not line or "-->" in line:
                 continue
-            if line.startswith("WEBVTT"):
+            if line.isdigit():  # Line numbers
                 continue
-            if "-->" in line:  # Timing line
-                continue
-            if re.match(r"^\d+$", line):  # Line numbers
-                continue
-            if line.startswith("Kind:") or line.startswith("Language:"):
-                continue
-            if line.startswith("<?xml") or line.startswith("<tt") or line.startswith("</tt"):
+            if line.startswith(_CAPTION_HEADER_PREFIXES):
                 continue
             # Remove HTML/XML tags like <c>, </c>, <00:00:00.000>
-            clean_line = re.sub(r"<[^>]+>", "", line)
-            if clean_line.strip():
-                text_lines.append(clean_line.strip())
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_lines = []
-        for line in text_lines:
-            if line not in seen:
-                seen.add(line)
-                unique_lines.append(line)
+            clean_line = _HTML_TAG_RE.sub("", line).strip()
+            # Remove duplicates while preserving order
+            if clean_line and clean_line not in seen:
+                seen.add(clean_line)
+                unique_lines.append(clean_line)
         
         return " ".join(unique_lines)
 
-    def get_transcript(self, video_url: str) -> dict:
+    async def get_transcript(self, video_url: str) -> dict:
         """Get transcript - tries YouTube captions first, falls back to Whisper"""
         audio_path = None
+        audio_task = None
+        cancel_download = threading.Event()
         try:
             video_id = self.extract_video_id(video_url)
             logger.info(f"Processing YouTube video: {video_id}")
 
-            # Method 1: Try to get existing YouTube captions (faster, more reliable)
+            # Method 1: Try to get existing YouTube captions (faster, more reliable).
+            # The audio download starts speculatively alongside the caption probe.
             logger.info("🔍 Checking for YouTube captions...")
-            captions = self._get_youtube_captions(video_url)
+            captions_task = asyncio.create_task(asyncio.to_thread(self._get_youtube_captions, video_url))
+            audio_task = asyncio.create_task(asyncio.to_thread(self._download_audio, video_url, cancel_download))
+
+            captions = await captions_task
             if captions:
                 logger.info("✅ Using YouTube captions")
                 return captions
 
             # Method 2: Fall back to audio download + Whisper
-            logger.info("📥 No captions found, downloading audio for Whisper...")
-            audio_path = self._download_audio(video_url)
+            logger.info("📥 No captions found, waiting for audio download for Whisper...")
+            audio_path = await audio_task
             logger.info(f"✅ Audio downloaded: {os.path.getsize(audio_path)} bytes")
 
             logger.info("🎤 Transcribing with Whisper (local)...")
-            result = self.model.transcribe(audio_path, language="ru")
+            transcript_text = await asyncio.to_thread(self._transcribe_audio, audio_path)
 
-            if not result.get("text"):
+            if not transcript_text:
                 raise HTTPException(status_code=500, detail="Whisper returned empty result")
 
-            transcript_text = result["text"].strip()
             logger.info(f"✅ Transcription complete: {len(transcript_text)} characters")
 
             return {
@@ -230,29 +252,61 @@ class YouTubeTranscriber:
             raise HTTPException(status_code=500, detail=f"Transcription failed: {str(e)}")
 
         finally:
-            if audio_path and os.path.exists(audio_path):
-                try:
-                    os.unlink(audio_path)
-                    # Also try to remove the temp directory
-                    temp_dir = os.path.dirname(audio_path)
-                    if temp_dir and os.path.exists(temp_dir):
-                        import shutil
-                        shutil.rmtree(temp_dir, ignore_errors=True)
-                except Exception as cleanup_err:
-                    logger.warning(f"Could not delete temp audio file: {cleanup_err}")
-
-    def _download_audio(self, video_url: str) -> str:
-        """Download audio from YouTube as MP3"""
+            if audio_task is not None and audio_path is None:
+                # Stop the speculative download and drop whatever it left behind
+                cancel_download.set()
+                audio_task.add_done_callback(self._discard_audio_task)
+            self._remove_audio(audio_path)
+
+    @classmethod
+    def _discard_audio_task(cls, task: asyncio.Task) -> None:
+        """Clean up after an audio download whose result is no longer needed"""
+        if task.cancelled() or task.exception() is not None:
+            return
+        cls._remove_audio(task.result())
+
+    @staticmethod
+    def _remove_audio(audio_path: str | None) -> None:
+        """Delete a downloaded audio file and its temp directory"""
+        if audio_path and os.path.exists(audio_path):
+            try:
+                os.unlink(audio_path)
+                # Also try to remove the temp directory
+                temp_dir = os.path.dirname(audio_path)
+                if temp_dir and os.path.exists(temp_dir):
+                    shutil.rmtree(temp_dir, ignore_errors=True)
+            except Exception as cleanup_err:
+                logger.warning(f"Could not delete temp audio file: {cleanup_err}")
+
+    def _transcribe_audio(self, audio_path: str) -> str:
+        """Run Whisper on a downloaded audio file"""
+        audio = self._load_audio(audio_path)
+        segments, _ = self.model.transcribe(
+            audio,
+            language="ru",
+            beam_size=1,
+            vad_filter=True  # skip silence
+        )
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+    def _download_audio(self, video_url: str, cancel_event: threading.Event | None = None) -> str:
+        """Download the original YouTube audio stream (no re-encoding)"""
+        tmp_dir = tempfile.mkdtemp()
+
+        def check_cancelled(_progress: dict) -> None:
+            if cancel_event is not None and cancel_event.is_set():
+                raise DownloadCancelled()
+
         try:
-            tmp_dir = tempfile.mkdtemp()
             output_template = os.path.join(tmp_dir, "%(id)s.%(ext)s")
 
             ydl_opts = {
-                "format": "bestaudio/best",
+                "format": "bestaudio[ext=m4a]/bestaudio/best",
                 "outtmpl": output_template,
                 "quiet": True,
                 "noplaylist": True,
                 "no_warnings": True,
+                "progress_hooks": [check_cancelled],
                 # Anti-403 options
                 "http_headers": {
                     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
@@ -265,25 +319,43 @@ class YouTubeTranscriber:
                         "player_client": ["android", "web"],
                     }
                 },
-                "postprocessors": [
-                    {
-                        "key": "FFmpegExtractAudio",
-                        "preferredcodec": "mp3",
-                        "preferredquality": "192",
-                    }
-                ],
             }
 
             with YoutubeDL(ydl_opts) as ydl:
                 info = ydl.extract_info(video_url, download=True)
-                downloaded_path = ydl.prepare_filename(info)
-                audio_path = os.path.splitext(downloaded_path)[0] + ".mp3"
+                audio_path = ydl.prepare_filename(info)
 
             if not os.path.exists(audio_path) or os.path.getsize(audio_path) == 0:
                 raise HTTPException(status_code=500, detail="Failed to download audio from YouTube")
 
             return audio_path
 
+        except DownloadCancelled:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            logger.info("Audio download cancelled")
+            raise
         except Exception as e:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
             logger.error(f"Audio download failed: {e}")
             raise HTTPException(status_code=500, detail="Failed to download audio from YouTube")
+
+    @staticmethod
+    def _load_audio(audio_path: str, sample_rate: int = 16000) -> np.ndarray:
+        """Decode audio to 16 kHz mono float32 PCM in a single ffmpeg pass"""
+        try:
+            result = subprocess.run(
+                [
+                    "ffmpeg", "-nostdin", "-loglevel", "error",
+                    "-i", audio_path,
+                    "-ac", "1", "-ar", str(sample_rate),
+                    "-f", "s16le", "-"
+                ],
+                capture_output=True,
+                check=True
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            stderr = getattr(e, "stderr", b"") or b""
+            logger.error(f"Audio decoding failed: {e} {stderr.decode(errors='ignore')}")
+            raise HTTPException(status_code=500, detail="Failed to decode downloaded audio")
+
+        return np.frombuffer(result.stdout, np.int16).astype(np.float32) / 32768.0
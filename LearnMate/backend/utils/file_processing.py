@@ -1,33 +1,90 @@
-import nbformat
-from nbformat import NotebookNode
-from PyPDF2 import PdfReader
+import pypdfium2 as pdfium
 import docx
 import pptx
 from typing import Union, Optional
+import io
+import itertools
 import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import List
+from utils.notebook import iter_code_cells
 
 
 
 logger = logging.getLogger(__name__)
 
+NOTEBOOK_MAX_CELLS = 10
+PDF_POOL_MIN_PAGES = 8  # below this, process start-up costs more than it saves
+_PDF_WORKERS = os.cpu_count() or 1
+# Workers come from a clean forkserver instead of forking the busy parent, whose threads
+# (to_thread workers, aiosqlite, CTranslate2, pdfium) may be holding locks at fork time
+_PDF_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+if _PDF_MP_CONTEXT.get_start_method() == "forkserver":
+    # Preload just this module rather than __main__, which would build every model
+    _PDF_MP_CONTEXT.set_forkserver_preload([__name__])
+_PDF_POOL = ProcessPoolExecutor(max_workers=_PDF_WORKERS, mp_context=_PDF_MP_CONTEXT)
+_PDF_POOL_LOCK = threading.Lock()  # guards replacing a broken pool
+_PDFIUM_LOCK = threading.Lock()  # pdfium must not be used from several threads at once
+
+
+def _extract_pdf_pages(path: str, start: int, stop: int) -> str:
+    """Extract text from pages [start, stop) of a PDF file (runs in a worker process)"""
+    pdf = pdfium.PdfDocument(path)
+    try:
+        return '\n'.join(pdf[i].get_textpage().get_text_range() for i in range(start, stop))
+    finally:
+        pdf.close()
+
+
+def _map_pdf_pages(data: bytes, starts, stops) -> str:
+    """Extract page ranges in the worker pool, rebuilding it once if a worker has died"""
+    global _PDF_POOL
+    # Workers read one shared temp file instead of each range pickling the whole PDF
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(data)
+    try:
+        for attempt in range(2):
+            pool = _PDF_POOL
+            try:
+                return '\n'.join(pool.map(_extract_pdf_pages, itertools.repeat(tmp.name), starts, stops))
+            except BrokenProcessPool:
+                # A crashed worker (pdfium segfault, OOM kill) leaves the pool unusable for good
+                logger.warning("PDF worker pool is broken; starting a new one")
+                with _PDF_POOL_LOCK:
+                    if _PDF_POOL is pool:
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        _PDF_POOL = ProcessPoolExecutor(max_workers=_PDF_WORKERS, mp_context=_PDF_MP_CONTEXT)
+                if attempt:
+                    raise
+    finally:
+        os.remove(tmp.name)
+
+
 class FileProcessor:
     def extract_code_from_ipynb(self, file_content: bytes) -> str:
         """Memory-efficient notebook processing"""
         try:
-            nb = nbformat.reads(file_content.decode('utf-8'), as_version=4)
-            output = []
-            
-            for idx, cell in enumerate(nb.cells):
-                if cell.cell_type == 'code':
-                    lines = cell.source.count('\n') + 1
-                    output.append(f"\n=== Code Cell (Lines: {lines}) ===\n{cell.source}\n")
-                    if len(output) > 10:
-                        output.append("\n...[truncated due to size]")
-                        break
-
-            
-            return "".join(output)
+            buf = io.StringIO()
+            count = 0
+
+            for src in iter_code_cells(file_content):
+                if count >= NOTEBOOK_MAX_CELLS:
+                    buf.write("\n...[truncated due to size]")
+                    break
+                lines = src.count('\n') + 1
+                buf.write(f"\n=== Code Cell (Lines: {lines}) ===\n")
+                buf.write(src)
+                buf.write("\n")
+                count += 1
+
+            return buf.getvalue()
         except Exception as e:
             logger.error(f"Notebook processing failed: {str(e)}")
             return "Failed to process notebook"
@@ -36,8 +93,24 @@ class FileProcessor:
     def extract_text_from_pdf(self, file_stream) -> str:
         """Extract text from PDF files"""
         try:
-            reader = PdfReader(file_stream)
-            return '\n'.join(page.extract_text() or '' for page in reader.pages)
+            data = file_stream.read() if hasattr(file_stream, 'read') else file_stream
+            with _PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(data)
+                try:
+                    n_pages = len(pdf)
+                    if n_pages < PDF_POOL_MIN_PAGES:
+                        return '\n'.join(page.get_textpage().get_text_range() for page in pdf)
+                finally:
+                    pdf.close()
+
+            # Large documents: fan contiguous page ranges out to worker processes
+            step = -(-n_pages // _PDF_WORKERS)
+            starts = range(0, n_pages, step)
+            stops = [min(start + step, n_pages) for start in starts]
+            return _map_pdf_pages(data, starts, stops)
+        except BrokenProcessPool:
+            # Not the document's fault; let the caller report a processing failure
+            raise
         except Exception as e:
             logger.error(f"PDF extraction failed: {str(e)}")
             raise ValueError("Invalid PDF file")
@@ -55,12 +128,12 @@ class FileProcessor:
         """Extract text from PowerPoint files"""
         try:
             prs = pptx.Presentation(file_stream)
-            text = []
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, "text"):
-                        text.append(shape.text)
-            return '\n'.join(text)
+            return '\n'.join(
+                shape.text_frame.text
+                for slide in prs.slides
+                for shape in slide.shapes
+                if shape.has_text_frame
+            )
         except Exception as e:
             logger.error(f"PPTX extraction failed: {str(e)}")
             raise ValueError("Invalid PowerPoint file")
@@ -1,8 +1,6 @@
-import os
 import io
 import logging
 from typing import Union
-import nbformat
 
 
 logger = logging.getLogger(__name__)
@@ -10,7 +8,8 @@ logger = logging.getLogger(__name__)
 class Helpers:
     @staticmethod
     def get_file_extension(filename: str) -> str:
-        return os.path.splitext(filename)[1].lower()
+        head, dot, ext = filename.rpartition('.')
+        return (dot + ext).lower() if head else ""
 
     @staticmethod
     def create_file_response(content: Union[str, bytes], 
@@ -19,12 +18,12 @@ class Helpers:
         if isinstance(content, str):
             content = content.encode('utf-8')
             
-        file_obj = io.BytesIO(content)
-        file_obj.seek(0)
-        return file_obj
+        # BytesIO starts positioned at 0, no seek needed
+        return io.BytesIO(content)
     
     # @staticmethod
     # def create_notebook_with_explanation(code: str, explanation: str, filename: str = "code_analysis.ipynb") -> bytes:
+    #     import nbformat  # imported lazily; it pulls in jsonschema/traitlets
     #     nb = nbformat.v4.new_notebook()
     #     # Add code cell
     #     nb.cells.append(nbformat.v4.new_code_cell(code))
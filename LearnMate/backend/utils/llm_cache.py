@@ -0,0 +1,92 @@
+# backend/utils/llm_cache.py
+import asyncio
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+import aiosqlite
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600))  # seconds
+
+_db: Optional[aiosqlite.Connection] = None
+_db_lock = asyncio.Lock()
+
+
+async def _get_db() -> aiosqlite.Connection:
+    """Open the cache database once and reuse the connection"""
+    global _db
+    if _db is None:
+        async with _db_lock:
+            if _db is None:
+                db = await aiosqlite.connect(CACHE_PATH)
+                await db.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache "
+                    "(key TEXT PRIMARY KEY, value TEXT, created_at REAL)"
+                )
+                # Lets the expiry DELETE in set_cached use a range scan instead of a full one
+                await db.execute(
+                    "CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)"
+                )
+                await db.commit()
+                _db = db
+    return _db
+
+
+async def close() -> None:
+    """Close the cache database; aiosqlite's worker thread would otherwise keep the process alive"""
+    global _db
+    async with _db_lock:
+        if _db is not None:
+            db, _db = _db, None
+            await db.close()
+
+
+async def get_cached(key: str) -> Optional[str]:
+    """Return the cached value for key, or None if missing or expired"""
+    try:
+        db = await _get_db()
+        async with db.execute(
+            "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row and time.time() - row[1] < CACHE_TTL:
+            logger.info(f"LLM cache hit: {key[:12]}")
+            return row[0]
+    except Exception as e:
+        logger.warning(f"LLM cache lookup failed: {str(e)}")
+    return None
+
+
+async def set_cached(key: str, value: str) -> None:
+    """Store value under key and evict expired entries"""
+    # Only cache real answers; empty results are retried next time
+    if not value:
+        return
+    try:
+        db = await _get_db()
+        now = time.time()
+        await db.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+            (key, value, now)
+        )
+        await db.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - CACHE_TTL,))
+        await db.commit()
+    except Exception as e:
+        logger.warning(f"LLM cache write failed: {str(e)}")
+
+
+async def get_or_call(key: str, coro_factory: Callable[[], Awaitable[str]]) -> str:
+    """Return the cached result for key, or await coro_factory() and cache it"""
+    cached = await get_cached(key)
+    if cached is not None:
+        return cached
+
+    # Failures raise out of coro_factory and are never cached
+    value = await coro_factory()
+    await set_cached(key, value)
+    return value
@@ -0,0 +1,23 @@
+# backend/utils/notebook.py
+import itertools
+from typing import Iterator, Optional
+
+import orjson
+
+
+def iter_code_cells(content: bytes) -> Iterator[str]:
+    """Yield the source of every code cell in a raw .ipynb file"""
+    nb = orjson.loads(content)
+    for cell in nb.get("cells", ()):
+        if cell.get("cell_type") != "code":
+            continue
+        src = cell.get("source", "")
+        yield "".join(src) if isinstance(src, list) else src
+
+
+def extract_code(content: bytes, limit_cells: Optional[int] = None, separator: str = "\n\n") -> str:
+    """Join the code cells of a raw .ipynb file, optionally keeping only the first limit_cells"""
+    cells = iter_code_cells(content)
+    if limit_cells is not None:
+        cells = itertools.islice(cells, limit_cells)
+    return separator.join(cells)
@@ -1,10 +1,12 @@
+import asyncio
+import hashlib
 import os
 import tempfile
 import logging
-import requests
-from tempfile import NamedTemporaryFile
+import httpx
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
+    AIORateLimiter,
     ApplicationBuilder,
     CommandHandler,
     MessageHandler,
@@ -12,11 +14,14 @@ from telegram.ext import (
     ContextTypes,
     filters
 )
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from io import BytesIO
 from telegram import ReplyKeyboardMarkup
+import html
 import re
+import time
 import traceback
+from collections import deque
 
 
 # Configuration
@@ -29,11 +34,117 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 
 BACKEND_URL = os.getenv("BACKEND_URL")
 MAX_MESSAGE_LENGTH = 4000  # Telegram message length limit
+INLINE_EXPLANATION_LIMIT = 3800  # leaves room for the header/footer markup
+SPOOL_MAX_SIZE = 1_000_000  # downloads larger than this are spooled to disk
+WORKER_COUNT = int(os.getenv("BOT_WORKERS", 16))  # chats processed concurrently
+OFFLOAD_THRESHOLD = 256 * 1024  # texts longer than this are encoded in a worker thread
+
+SUPPORTED_TYPES = {
+    '.pdf': 'PDF Document',
+    '.docx': 'Word Document',
+    '.pptx': 'PowerPoint',
+    '.ipynb': 'Jupyter Notebook',
+    '.txt': 'Text File',
+    '.py': 'Python Script'
+}
+SUPPORTED_EXTENSIONS = frozenset(SUPPORTED_TYPES)
+SUPPORTED_TYPES_LIST = "\n".join(f"- {desc} ({ext})" for ext, desc in SUPPORTED_TYPES.items())
+
+ANALYSIS_NAMES = {
+    "explain": "Explanation",
+    "implement": "Implementation Guide",
+    "review": "Code Review"
+}
+
+
+# Shared, connection-pooled client for all backend calls; keep-alive lets the
+# /health probe and the following request reuse one connection
+# (httpx ignores the client's limits= when a transport is given, so they go on the transport)
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(60.0, connect=5.0),
+    transport=httpx.AsyncHTTPTransport(
+        retries=2,  # retry failed connection attempts
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=100)
+    )
+)
+
+HEALTH_TTL = 10  # seconds a successful /health probe is trusted
+_HEALTH = {"ok": False, "ts": 0.0}
+
+
+async def ensure_healthy() -> None:
+    """Probe backend /health at most once per HEALTH_TTL; raise ConnectionError if it is down"""
+    if _HEALTH["ok"] and time.monotonic() - _HEALTH["ts"] < HEALTH_TTL:
+        return
+    try:
+        health_check = await http_client.get(f"{BACKEND_URL}/health", timeout=5)
+        healthy = health_check.status_code == 200
+    except httpx.HTTPError:
+        _HEALTH["ok"] = False
+        raise ConnectionError("Could not reach backend")
+
+    # Only successes are cached so a recovering backend is noticed immediately
+    _HEALTH["ok"] = healthy
+    _HEALTH["ts"] = time.monotonic()
+    if not healthy:
+        raise ConnectionError("Backend not healthy")
+
+
+def file_digest(file_obj) -> str:
+    """BLAKE2b digest of a file object's content; leaves the file positioned at 0"""
+    digest = hashlib.blake2b(digest_size=16)
+    file_obj.seek(0)
+    for chunk in iter(lambda: file_obj.read(64 * 1024), b""):
+        digest.update(chunk)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+
+def is_cacheable(result_text: str) -> bool:
+    """Whether a successful backend result is a real answer worth reusing"""
+    # Model failures may still arrive as "⚠️ ..." text with status success; a re-send must retry them
+    return bool(result_text) and not result_text.startswith("⚠️")
+
+
+def backend_error_text(response: httpx.Response) -> str:
+    """User-facing text for a non-200 backend response, using its 'detail' when it has one"""
+    try:
+        detail = response.json().get('detail')
+    except (ValueError, AttributeError):
+        detail = None
+    if not isinstance(detail, str) or not detail:
+        return f"❌ Backend error (status {response.status_code})"
+    # Model failures already arrive as "⚠️ ..." text
+    return detail if detail.startswith("⚠️") else f"❌ {detail}"
+
+
+def upload_content(file_obj):
+    """Upload payload for a spooled download: its bytes while in memory, the file once on disk"""
+    # httpx sizes file objects through fileno(), which would roll an in-memory spool onto disk
+    file_obj.seek(0, os.SEEK_END)
+    size = file_obj.tell()
+    file_obj.seek(0)
+    return file_obj.read() if size <= SPOOL_MAX_SIZE else file_obj
+
+
+def get_file_extension(filename: str) -> str:
+    """Copy of backend Helpers.get_file_extension; the bot runs separately and cannot import backend code"""
+    head, dot, ext = filename.rpartition('.')
+    return (dot + ext).lower() if head else ""
+
+
+async def encode_text(text: str) -> bytes:
+    """UTF-8 encode text, off the event loop when it is large enough to stall other chats"""
+    if len(text) > OFFLOAD_THRESHOLD:
+        return await asyncio.to_thread(text.encode, 'utf-8')
+    return text.encode('utf-8')
 
 
 YOUTUBE_URL_REGEX = re.compile(
-    r'(https?://)?(www\.)?(youtube\.com/watch\?v=|youtu\.be/)[\w-]+'
+    r'\b(https?://)?(www\.)?(youtube\.com/watch\?v=|youtu\.be/)[\w-]+',
+    re.ASCII
 )
+_CONTENT_DISPOSITION_RE = re.compile(r'filename="([^"]+)"')
 
 # Logging setup
 logging.basicConfig(
@@ -42,30 +153,80 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def get_main_menu_keyboard():
-    keyboard = [
-        [InlineKeyboardButton("📄 Translate Document", callback_data="translate")],
-        [InlineKeyboardButton("💻 Analyze Code", callback_data="analyze")],
-        [InlineKeyboardButton("🎬 Transcribe YouTube", callback_data="transcribe")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-def get_analysis_type_keyboard():
-    """Keyboard for choosing analysis type"""
-    keyboard = [
-        [InlineKeyboardButton("🔍 Explain Code", callback_data="analyze_explain")],
-        [InlineKeyboardButton("🚀 Implementation Guide", callback_data="analyze_implement")],
-        [InlineKeyboardButton("📋 Code Review", callback_data="analyze_review")],
-        [InlineKeyboardButton("🔙 Back to Menu", callback_data="menu")]
-    ]
-    return InlineKeyboardMarkup(keyboard)
+# Keyboards are built once and shared; PTB objects are immutable so reuse is safe
+MAIN_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📄 Translate Document", callback_data="translate")],
+    [InlineKeyboardButton("💻 Analyze Code", callback_data="analyze")],
+    [InlineKeyboardButton("🎬 Transcribe YouTube", callback_data="transcribe")]
+])
+
+# Keyboard for choosing analysis type
+ANALYSIS_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔍 Explain Code", callback_data="analyze_explain")],
+    [InlineKeyboardButton("🚀 Implementation Guide", callback_data="analyze_implement")],
+    [InlineKeyboardButton("📋 Code Review", callback_data="analyze_review")],
+    [InlineKeyboardButton("🔙 Back to Menu", callback_data="menu")]
+])
+
+BACK_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔙 Back to Menu", callback_data="menu")]
+])
+
+CHANGE_ANALYSIS_MENU = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔙 Change Analysis Type", callback_data="analyze")]
+])
 
 
 class BotHandler:
     def __init__(self):
-        self.supported_extensions = {".pdf", ".docx", ".pptx", ".txt", ".ipynb", ".py"}
         self.youtube_domains = {"youtube.com", "youtu.be"}
-
+        self._jobs: asyncio.Queue[int] = asyncio.Queue()  # chats with pending updates
+        self._chat_jobs: dict[int, deque] = {}  # chat_id -> queued (handler, update, context)
+        self._workers: list[asyncio.Task] = []
+        self._queue_button = self.per_chat(self._handle_button)
+        # Successful backend responses keyed by (content digest, filename, action[, analysis type])
+        self._response_cache = TTLCache(maxsize=256, ttl=3600)
+
+    def per_chat(self, handler):
+        """Queue handler for the worker pool, one update at a time per chat"""
+        async def dispatch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+            # Return to the dispatcher immediately so other chats are not held up
+            chat_id = update.effective_chat.id
+            pending = self._chat_jobs.get(chat_id)
+            if pending is None:
+                # No worker owns this chat yet; hand it to the next free one
+                pending = self._chat_jobs[chat_id] = deque()
+                self._jobs.put_nowait(chat_id)
+            pending.append((handler, update, context))
+        return dispatch
+
+    async def _worker(self) -> None:
+        """Take a chat off the job queue and run its updates in order until none are left"""
+        while True:
+            chat_id = await self._jobs.get()
+            pending = self._chat_jobs[chat_id]
+            try:
+                while pending:
+                    handler, update, context = pending.popleft()
+                    try:
+                        await handler(update, context)
+                    except Exception:
+                        logger.error("Background handler failed", exc_info=True)
+            finally:
+                # Nothing was queued since the last check; drop the entry so the dict does not grow
+                self._chat_jobs.pop(chat_id, None)
+                self._jobs.task_done()
+
+    async def start_workers(self, app) -> None:
+        """Spawn the worker pool once the application is initialized"""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(WORKER_COUNT)]
+
+    async def stop_workers(self, app) -> None:
+        """Cancel the worker pool when the application stops"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
 
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         welcome_text = (
@@ -75,7 +236,7 @@ class BotHandler:
             "• Analyze and explain code\n"
             "• Transcribe YouTube videos\n"
         )
-        reply_markup = get_main_menu_keyboard()
+        reply_markup = MAIN_MENU
         await update.message.reply_text(welcome_text, reply_markup=reply_markup)
 
 
@@ -83,22 +244,25 @@ class BotHandler:
         """Show main menu anytime"""
         await update.message.reply_text(
             "🔹 Main Menu: Choose an action",
-            reply_markup=get_main_menu_keyboard()
+            reply_markup=MAIN_MENU
         )
 
 
     async def button_handler(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Acknowledge a button press at once and queue the rest behind the chat's earlier updates"""
+        await update.callback_query.answer()
+        await self._queue_button(update, context)
+
+    async def _handle_button(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle inline keyboard button presses"""
         query = update.callback_query
-        await query.answer()
-        
         action = query.data
         
         if action == "menu":
             # Return to main menu
             await query.edit_message_text(
                 "🔹 Main Menu: Choose an action",
-                reply_markup=get_main_menu_keyboard()
+                reply_markup=MAIN_MENU
             )
             return
                 # Handle analysis type selection
@@ -108,9 +272,7 @@ class BotHandler:
             await query.edit_message_text(
                 f"💻 Analysis mode: {analysis_type.replace('_', ' ').title()}\n\n"
                 "Send me your code file (.py, .ipynb, .txt) to analyze:",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("🔙 Change Analysis Type", callback_data="analyze")]
-                ])
+                reply_markup=CHANGE_ANALYSIS_MENU
             )
             return
         
@@ -122,7 +284,7 @@ class BotHandler:
             # Show analysis type selection
             await query.edit_message_text(
                 "🔍 Choose analysis type:",
-                reply_markup=get_analysis_type_keyboard()
+                reply_markup=ANALYSIS_MENU
             )
             return
         
@@ -133,13 +295,9 @@ class BotHandler:
         }
         
         # Add back to menu button
-        reply_markup = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🔙 Back to Menu", callback_data="menu")]
-        ])
-        
         await query.edit_message_text(
             text=action_texts.get(action, "Please send me your file or URL"),
-            reply_markup=reply_markup
+            reply_markup=BACK_MENU
         )
 
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -147,21 +305,23 @@ class BotHandler:
         action = context.user_data.get("action")
 
         if not action and update.message.text:
-            if YOUTUBE_URL_REGEX.search(update.message.text):
+            match = YOUTUBE_URL_REGEX.search(update.message.text)
+            if match:
                 context.user_data["action"] = "transcribe"
+                context.user_data["yt_url"] = match.group(0)  # reused by handle_youtube_link
                 await self.handle_youtube_link(update, context)
                 return
             else:
                 await update.message.reply_text(
                     "⚠️ Please choose an action first!",
-                    reply_markup=get_main_menu_keyboard()
+                    reply_markup=MAIN_MENU
                 )
                 return
             
         if not action:
             await update.message.reply_text(
                 "⚠️ Please choose an action first!",
-                reply_markup=get_main_menu_keyboard()
+                reply_markup=MAIN_MENU
             )
             return            
 
@@ -174,19 +334,19 @@ class BotHandler:
                 else:
                     await update.message.reply_text(
                         f"⚠️ For {action}, please send a file",
-                        reply_markup=get_main_menu_keyboard()
+                        reply_markup=MAIN_MENU
                     )
             else:
                 await update.message.reply_text(
                     "⚠️ Unsupported message type",
-                    reply_markup=get_main_menu_keyboard()
+                    reply_markup=MAIN_MENU
                 )
 
         except Exception as e:
             logger.error(f"Error during '{action}' processing: {e}")
             await update.message.reply_text(
                 f"⚠️ An error occurred during {action}. Please try again.",
-                reply_markup=get_main_menu_keyboard()
+                reply_markup=MAIN_MENU
             )
             context.user_data.pop("action", None)
             context.user_data.pop("analysis_type", None)
@@ -195,20 +355,10 @@ class BotHandler:
     async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         document = update.message.document
         filename = document.file_name
-        file_ext = os.path.splitext(filename)[1].lower()
+        file_ext = get_file_extension(filename)
         
-        SUPPORTED_TYPES = {
-            '.pdf': 'PDF Document',
-            '.docx': 'Word Document',
-            '.pptx': 'PowerPoint',
-            '.ipynb': 'Jupyter Notebook',
-            '.txt': 'Text File',
-            '.py': 'Python Script'
-        }
-        
-        if file_ext not in SUPPORTED_TYPES:
-            types_list = "\n".join([f"- {desc} ({ext})" for ext, desc in SUPPORTED_TYPES.items()])
-            await update.message.reply_text(f"❌ Unsupported file type. Supported types:\n{types_list}")
+        if file_ext not in SUPPORTED_EXTENSIONS:
+            await update.message.reply_text(f"❌ Unsupported file type. Supported types:\n{SUPPORTED_TYPES_LIST}")
             return
 
         try:
@@ -231,18 +381,24 @@ class BotHandler:
             logger.error(traceback.format_exc())
             await update.message.reply_text("⚠️ An unexpected error occurred")
 
+    async def _download_document(self, context: ContextTypes.DEFAULT_TYPE, document):
+        """Download a Telegram document into a spooled temp file (in memory until it grows large)"""
+        file = await context.bot.get_file(document.file_id)
+        file_obj = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        try:
+            await file.download_to_memory(out=file_obj)
+            file_obj.seek(0)
+        except Exception:
+            file_obj.close()
+            raise
+        return file_obj
+
     async def _handle_code_analysis(self, update: Update, context: ContextTypes.DEFAULT_TYPE, 
                                   document, filename: str, file_ext: str, analysis_type: str):
         """Handle code analysis requests"""
         try:
             # Get analysis type display name
-            analysis_names = {
-                "explain": "Explanation",
-                "implement": "Implementation Guide", 
-                "review": "Code Review"
-            }
-            
-            analysis_name = analysis_names.get(analysis_type, "Analysis")
+            analysis_name = ANALYSIS_NAMES.get(analysis_type, "Analysis")
             
             # Special message for notebooks
             if file_ext == '.ipynb':
@@ -257,48 +413,44 @@ class BotHandler:
                 timeout = 90
 
             # Check backend health
-            try:
-                health_check = requests.get(f"{BACKEND_URL}/health", timeout=5)
-                if health_check.status_code != 200:
-                    raise ConnectionError("Backend not healthy")
-            except requests.exceptions.RequestException:
-                raise ConnectionError("Could not reach backend")
-
-            # Download file
-            file = await context.bot.get_file(document.file_id)
-            file_content = await file.download_as_bytearray()
-
-            # Prepare request
-            files = {'file': (filename, BytesIO(file_content))}
-            data = {'analysis_type': analysis_type}
-
-            # Send to backend
-            response = requests.post(
-                f"{BACKEND_URL}/analyze_code",
-                files=files,
-                data=data,
-                timeout=timeout
-            )
-
-            if response.status_code == 200:
-                response_data = response.json()
-                if response_data.get('status') == 'success':
-                    await self._handle_analysis_response(update, response_data, analysis_name)
-                else:
-                    error_msg = response_data.get('error', 'Unknown error')
-                    await update.message.reply_text(f"❌ Analysis error: {error_msg}")
+            await ensure_healthy()
+
+            # Download file and stream it to the backend, unless this exact file was just analyzed
+            with await self._download_document(context, document) as file_obj:
+                cache_key = (file_digest(file_obj), filename, "analyze", analysis_type)
+                response_data = self._response_cache.get(cache_key)
+                if response_data is None:
+                    files = {'file': (filename, upload_content(file_obj))}
+                    data = {'analysis_type': analysis_type}
+
+                    response = await http_client.post(
+                        f"{BACKEND_URL}/analyze_code",
+                        files=files,
+                        data=data,
+                        timeout=timeout
+                    )
+                    if response.status_code != 200:
+                        await update.message.reply_text(backend_error_text(response))
+                        return
+                    response_data = response.json()
+
+            if response_data.get('status') == 'success':
+                if is_cacheable(response_data.get('explanation', '')):
+                    self._response_cache[cache_key] = response_data
+                await self._handle_analysis_response(update, context, response_data, analysis_name)
             else:
-                await update.message.reply_text(f"❌ Backend error (status {response.status_code})")
+                error_msg = response_data.get('error', 'Unknown error')
+                await update.message.reply_text(f"❌ Analysis error: {error_msg}")
 
-        except requests.Timeout:
+        except httpx.TimeoutException:
             await update.message.reply_text(
                 "⌛ Analysis timed out. Try these solutions:\n"
                 "1. Export notebook as .py file and try again\n"  
                 "2. Split code into smaller files\n"
                 "3. Try again later",
-                reply_markup=get_main_menu_keyboard()
+                reply_markup=MAIN_MENU
             )
-        except requests.exceptions.ConnectionError:
+        except (ConnectionError, httpx.TransportError):
             await update.message.reply_text("🔌 Backend service unavailable. Please try again later.")
         except Exception as e:
             logger.error(f"Code analysis failed: {str(e)}")
@@ -313,45 +465,43 @@ class BotHandler:
             await update.message.reply_text("🌍 Translating document...")
 
             # Check backend health
-            try:
-                health_check = requests.get(f"{BACKEND_URL}/health", timeout=5)
-                if health_check.status_code != 200:
-                    raise ConnectionError("Backend not healthy")
-            except requests.exceptions.RequestException:
-                raise ConnectionError("Could not reach backend")
-
-            # Download file
-            file = await context.bot.get_file(document.file_id)
-            file_content = await file.download_as_bytearray()
-
-            # Send to backend
-            files = {'file': (filename, BytesIO(file_content))}
-            response = requests.post(
-                f"{BACKEND_URL}/translate_file",
-                files=files,
-                timeout=60
-            )
-
-            if response.status_code == 200:
-                response_data = response.json()
-                if response_data.get('status') == 'success':
-                    await self._handle_translation_response(update, response_data)
-                else:
-                    error_msg = response_data.get('error', 'Unknown error')
-                    await update.message.reply_text(f"❌ Translation error: {error_msg}")
+            await ensure_healthy()
+
+            # Download file and stream it to the backend, unless this exact file was just translated
+            with await self._download_document(context, document) as file_obj:
+                cache_key = (file_digest(file_obj), filename, "translate")
+                response_data = self._response_cache.get(cache_key)
+                if response_data is None:
+                    files = {'file': (filename, upload_content(file_obj))}
+                    response = await http_client.post(
+                        f"{BACKEND_URL}/translate_file",
+                        files=files,
+                        timeout=60
+                    )
+                    if response.status_code != 200:
+                        await update.message.reply_text(backend_error_text(response))
+                        return
+                    response_data = response.json()
+
+            if response_data.get('status') == 'success':
+                if is_cacheable(response_data.get('translated_text', '')):
+                    self._response_cache[cache_key] = response_data
+                await self._handle_translation_response(update, context, response_data)
             else:
-                await update.message.reply_text(f"❌ Backend error (status {response.status_code})")
+                error_msg = response_data.get('error', 'Unknown error')
+                await update.message.reply_text(f"❌ Translation error: {error_msg}")
 
-        except requests.Timeout:
+        except httpx.TimeoutException:
             await update.message.reply_text("⌛ Translation timed out. Please try again.")
-        except requests.exceptions.ConnectionError:
+        except (ConnectionError, httpx.TransportError):
             await update.message.reply_text("🔌 Backend service unavailable. Please try again later.")
         except Exception as e:
             logger.error(f"Translation failed: {str(e)}")
             await update.message.reply_text("⚠️ An error occurred during translation")
 
         
-    async def _handle_analysis_response(self, update: Update, response_data: dict, analysis_name: str):
+    async def _handle_analysis_response(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                        response_data: dict, analysis_name: str):
         """Handle successful code analysis response"""
         try:
             explanation = response_data.get('explanation', '')
@@ -361,62 +511,54 @@ class BotHandler:
                 await update.message.reply_text("❌ No analysis generated")
                 return
 
-            # Escape HTML special characters
-            import html
-            safe_explanation = html.escape(explanation)
-
-            # Format with HTML instead of Markdown
-            response_text = (
-                f"<b>🔍 {analysis_name} of {filename}</b>\n\n"
-                f"<pre>{safe_explanation}</pre>\n\n"
-                "<b>💡 Analysis completed!</b>"
-            )
+            # Long explanations go out as a plain-text file, which needs no escaping
+            response_text = None
+            if len(explanation) <= INLINE_EXPLANATION_LIMIT:
+                # Escape HTML special characters
+                safe_explanation = html.escape(explanation)
+
+                # Format with HTML instead of Markdown
+                response_text = (
+                    f"<b>🔍 {analysis_name} of {filename}</b>\n\n"
+                    f"<pre>{safe_explanation}</pre>\n\n"
+                    "<b>💡 Analysis completed!</b>"
+                )
 
-            # Telegram message limit check
-            if len(response_text) > 4000:
-                from tempfile import NamedTemporaryFile
-                import os
-
-                with NamedTemporaryFile(mode='w', suffix='.txt', encoding='utf-8', delete=False) as f:
-                    f.write(explanation)
-                    temp_path = f.name
-
-                try:
-                    with open(temp_path, 'rb') as file_obj:
-                        await update.message.reply_document(
-                            document=file_obj,
-                            filename=f"analysis_{filename}.txt",
-                            caption=f"{analysis_name} completed ✅"
-                        )
-                finally:
-                    os.unlink(temp_path)
+            # Telegram message limit check (escaping can still push it over)
+            if response_text is None or len(response_text) > MAX_MESSAGE_LENGTH:
+                # Stays in memory for typical analyses, spills to disk only past the threshold
+                with tempfile.SpooledTemporaryFile(max_size=2 * 1024 * 1024) as file_obj:
+                    file_obj.write(await encode_text(explanation))
+                    file_obj.seek(0)
+                    await update.message.reply_document(
+                        document=file_obj,
+                        filename=f"analysis_{filename}.txt",
+                        caption=f"{analysis_name} completed ✅\nChoose another action:",
+                        reply_markup=MAIN_MENU
+                    )
             else:
+                # The menu rides along with the result instead of a separate message
                 await update.message.reply_text(
                     response_text,
-                    parse_mode="HTML"
+                    parse_mode="HTML",
+                    reply_markup=MAIN_MENU
                 )
 
-            # Safely clear context
-            context = update.message.bot.get_context() if hasattr(update.message, "bot") else None
-            if context:
-                context.user_data.pop("action", None)
-                context.user_data.pop("analysis_type", None)
-
-            await update.message.reply_text(
-                "✅ Analysis completed! Choose another action:",
-                reply_markup=get_main_menu_keyboard()
-            )
+            # Clear context
+            context.user_data.pop("action", None)
+            context.user_data.pop("analysis_type", None)
 
         except Exception as e:
             logger.error(f"Error handling analysis response: {str(e)}", exc_info=True)
             await update.message.reply_text(
                 "⚠️ Failed to process analysis results",
-                reply_markup=get_main_menu_keyboard()
+                reply_markup=MAIN_MENU
             )    
 
 
 
-    async def _handle_translation_response(self, update: Update, response_data: dict):
+    async def _handle_translation_response(self, update: Update, context: ContextTypes.DEFAULT_TYPE,
+                                           response_data: dict):
         """Handle successful translation response"""
         try:
             translated_content = response_data.get('translated_text', '')
@@ -426,37 +568,30 @@ class BotHandler:
                 await update.message.reply_text("❌ No translation generated")
                 return
 
-            # Create file object
-            file_obj = BytesIO(translated_content.encode('utf-8'))
-            file_obj.seek(0)
+            # PTB uploads bytes as-is, so no BytesIO wrapper is needed
+            file_bytes = await encode_text(translated_content)
             
-            # Send preview and document
-            preview = (
+            # Send document with the preview and menu in one message
+            caption = (
                 f"📄 Translation ready!\n"
                 f"Original: {response_data.get('source_chars', 0)} characters\n"
-                f"Download below:"
+                f"✅ Translation completed! Choose another action:"
             )
-            await update.message.reply_text(preview)
-            
             await update.message.reply_document(
-                document=file_obj,
-                filename=filename
+                document=file_bytes,
+                filename=filename,
+                caption=caption,
+                reply_markup=MAIN_MENU
             )
 
-            # Clear context and show menu
-            context = update.message._context
+            # Clear context
             context.user_data.pop("action", None)
             
-            await update.message.reply_text(
-                "✅ Translation completed! Choose another action:",
-                reply_markup=get_main_menu_keyboard()
-            )
-            
         except Exception as e:
             logger.error(f"Error handling translation response: {str(e)}")
             await update.message.reply_text(
                 "⚠️ Failed to process translation results",
-                reply_markup=get_main_menu_keyboard()
+                reply_markup=MAIN_MENU
             )
 
 
@@ -468,94 +603,103 @@ class BotHandler:
             await update.message.reply_text("❌ Please select transcription mode first using /start")
             return
 
-        match = YOUTUBE_URL_REGEX.search(text)
-        if not match:
-            await update.message.reply_text("❌ Please send a valid YouTube video URL.")
-            return
-
-        video_url = match.group(0)
+        # handle_message may already have matched the URL while routing
+        video_url = context.user_data.pop("yt_url", None)
+        if not video_url:
+            match = YOUTUBE_URL_REGEX.search(text)
+            if not match:
+                await update.message.reply_text("❌ Please send a valid YouTube video URL.")
+                return
+            video_url = match.group(0)
 
         try:
             # Check backend health
-            try:
-                health_check = requests.get(f"{BACKEND_URL}/health", timeout=5)
-                if health_check.status_code != 200:
-                    raise ConnectionError("Backend not healthy")
-            except requests.exceptions.RequestException:
-                raise ConnectionError("Could not reach backend")
+            await ensure_healthy()
 
             await update.message.reply_text("🔄 Fetching and transcribing YouTube video... ⏳ This may take 1-2 minutes.")
 
-            # Send request to backend
-            response = requests.post(
-                f"{BACKEND_URL}/transcribe_youtube",
-                json={"video_url": video_url},
-                timeout=600  # 10 minutes timeout for long videos
-            )
-
-            if response.status_code == 200:
-                # Backend now returns a file directly
-                file_content = response.content
-                
-                # Extract filename from response headers or use default
-                filename = "youtube_transcript.txt"
-                if 'content-disposition' in response.headers:
-                    content_disposition = response.headers['content-disposition']
-                    filename_match = re.search(r'filename="([^"]+)"', content_disposition)
-                    if filename_match:
-                        filename = filename_match.group(1)
-                
-                # Send the file to user
-                file_obj = BytesIO(file_content)
-                file_obj.seek(0)
-                
+            # Send request to backend and stream the transcript file back
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as file_obj:
+                async with http_client.stream(
+                    "POST",
+                    f"{BACKEND_URL}/transcribe_youtube",
+                    json={"video_url": video_url},
+                    timeout=600  # 10 minutes timeout for long videos
+                ) as response:
+                    if response.status_code != 200:
+                        await response.aread()
+                        error_detail = response.json().get('detail', 'Unknown error')
+                        raise Exception(f"Backend error: {error_detail}")
+
+                    # Backend now returns a file directly
+                    async for chunk in response.aiter_bytes(64 * 1024):
+                        file_obj.write(chunk)
+                    file_obj.seek(0)
+
+                    # Extract filename from response headers or use default
+                    filename = "youtube_transcript.txt"
+                    if 'content-disposition' in response.headers:
+                        content_disposition = response.headers['content-disposition']
+                        filename_match = _CONTENT_DISPOSITION_RE.search(content_disposition)
+                        if filename_match:
+                            filename = filename_match.group(1)
+
+                # Send the file with the menu in one message
                 await update.message.reply_document(
                     document=file_obj,
-                    filename=filename
+                    filename=filename,
+                    caption="✅ Transcription completed! Choose another action:",
+                    reply_markup=MAIN_MENU
                 )
 
-                # Clear action and show menu
-                context.user_data.pop("action", None)
-                
-                await update.message.reply_text(
-                    "✅ Transcription completed! Choose another action:",
-                    reply_markup=get_main_menu_keyboard()
-                )
-            else:
-                error_detail = response.json().get('detail', 'Unknown error')
-                raise Exception(f"Backend error: {error_detail}")
+            # Clear action
+            context.user_data.pop("action", None)
 
-        except requests.Timeout:
+        except httpx.TimeoutException:
             await update.message.reply_text("⌛ Transcription timed out. The video might be too long. Please try a shorter video.")
-        except ConnectionError:
+        except (ConnectionError, httpx.TransportError):
             await update.message.reply_text("🔌 Backend service unavailable. Please try again later.")
         except Exception as e:
             logger.error(f"❌ YouTube transcription failed: {str(e)}")
             await update.message.reply_text(f"⚠️ Failed to transcribe video: {str(e)}")
             await update.message.reply_text(
                 "Please try again or choose another action:",
-                reply_markup=get_main_menu_keyboard()
+                reply_markup=MAIN_MENU
             )
 
 
 
+async def close_http_client(app) -> None:
+    """Close the shared backend client when the bot stops"""
+    await http_client.aclose()
+
+
 def main() -> None:
     """Start the bot."""
     bot_handler = BotHandler()
     
-    app = ApplicationBuilder().token(TOKEN).build()
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .post_init(bot_handler.start_workers)
+        .post_stop(bot_handler.stop_workers)
+        # Keep outgoing messages under Telegram's ~30/s per-bot cap
+        .rate_limiter(AIORateLimiter(overall_max_rate=28, overall_time_period=1))
+        .post_shutdown(close_http_client)
+        .build()
+    )
     
     # Register handlers
     app.add_handler(CommandHandler("start", bot_handler.start))
     app.add_handler(CallbackQueryHandler(bot_handler.button_handler))
     
     # Document handler
-    app.add_handler(MessageHandler(filters.Document.ALL, bot_handler.handle_document))
+    app.add_handler(MessageHandler(filters.Document.ALL, bot_handler.per_chat(bot_handler.handle_document)))
     
     # Text message handler - only one needed that routes internally
     app.add_handler(MessageHandler(
         filters.TEXT & ~filters.COMMAND, 
-        bot_handler.handle_message
+        bot_handler.per_chat(bot_handler.handle_message)
     ))
     
     # Menu command